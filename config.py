@@ -1,58 +1,225 @@
 # -*- coding: utf-8 -*-
+import os
+import re
+import html
+import string
+import pathlib
+import functools
+from types import MappingProxyType
+from typing import Final
 
 # LLM Configuration
-MODEL_NAME = 'yandexgpt-lite'
-LLM_TEMP = 0.0
-MAX_TOKENS = 2000
+MODEL_NAME: Final[str] = 'yandexgpt-lite'
+LLM_TEMP: Final[float] = 0.0
+MAX_TOKENS: Final[int] = 2000
 
 # Vector Store Configuration
-OPENSEARCH_ENABLED = True # Set to True to use OpenSearch, False for other/no vector store
-OS_INDEX_NAME = 'miba-student-assist-hybrid-search' # OpenSearch index name
-# Path to the OpenSearch CA certificate. Assumes root.crt is in a .opensearch subfolder.
-CA_CERT_PATH = '.opensearch/root.crt'
-CHUNK_SIZE = 1500 # Optimized chunk size
-CHUNK_OVERLAP = 150 # Optimized chunk overlap
-BULK_SIZE = 1000000 # For OpenSearch bulk indexing
-K_MAX = 5 # Number of documents to retrieve
+OPENSEARCH_ENABLED: Final[bool] = True # Set to True to use OpenSearch, False for other/no vector store
+OS_INDEX_NAME: Final[str] = 'miba-student-assist-hybrid-search' # OpenSearch index name
+# Path to the OpenSearch CA certificate. Assumes root.crt is in a .opensearch subfolder next to this file.
+_HERE = pathlib.Path(__file__).resolve().parent
+CA_CERT_PATH: Final[str] = str(_HERE / '.opensearch' / 'root.crt')
+CHUNK_SIZE_TOKENS: Final[int] = 500 # Chunk size in tokens (300-800 keeps chunks semantically focused)
+TOKEN_ENCODING: Final[str] = 'cl100k_base' # tiktoken encoding used to measure chunk length
+# No overlap: an overlap ratio r inflates chunk count, index size and embedding calls by 1/(1-r)
+# without a retrieval gain once separators keep sentences intact.
+CHUNK_OVERLAP: Final[int] = 0
+# Paragraph, line, sentence and clause boundaries are tried before splitting on words
+SPLITTER_SEPARATORS: Final = ("\n\n", "\n", ". ", "! ", "? ", "; ", " ", "")
+# Split on embedding-similarity breakpoints instead (needs langchain_experimental; slower, embeds every sentence)
+SEMANTIC_CHUNKING: Final[bool] = False
+SPLIT_WORKERS: Final[int] = min(8, os.cpu_count() or 1) # Threads splitting documents into chunks
+BULK_ACTIONS: Final[int] = 500 # Max actions per OpenSearch bulk request
+BULK_MAX_BYTES: Final[int] = 100 * 1024 * 1024 # Max payload size per OpenSearch bulk request (100 MB)
+BULK_SIZE: Final[int] = BULK_ACTIONS # Backward-compatible alias
+# Parallel bulk indexing; the best values depend on data and cluster size, so both can be set via env
+BULK_THREADS: Final[int] = int(os.environ.get('BULK_THREADS', min(8, os.cpu_count() or 1)))
+BULK_QUEUE_SIZE: Final[int] = int(os.environ.get('BULK_QUEUE_SIZE', 4))
+INDEX_REFRESH_INTERVAL: Final[str] = '30s' # Index refresh interval in normal operation
+TRANSLOG_FLUSH_THRESHOLD_SIZE: Final[str] = '1gb' # Translog size that triggers a flush
+INGESTION_REFRESH_INTERVAL: Final[str] = '-1' # Refresh interval while bulk loading (-1 disables refresh)
+FORCEMERGE_TIMEOUT: Final[int] = 1800 # Seconds to wait for the post-build force merge to a single segment
+S3_DOWNLOAD_WORKERS: Final[int] = 16 # Threads downloading S3 files in parallel during ingestion
+HTTP_POOL_SIZE: Final[int] = 32 # Keep-alive connections for synchronous LLM REST calls
+METADATA_CONCURRENCY: Final[int] = 16 # Concurrent LLM metadata-extraction requests during ingestion
+EMBEDDING_MODEL: Final[str] = 'text-search-doc' # Yandex embedding model used for indexed chunks
+EMBED_BATCH_SIZE: Final[int] = 64 # Texts per embedding batch during indexing
+EMBED_MAX_CONCURRENCY: Final[int] = 4 # Embedding batches in flight at once
+API_MAX_RETRIES: Final[int] = 5 # Retries for a Foundation Models API call that hit 429/5xx or a connection error
+API_RETRY_BASE_DELAY: Final[float] = 0.5 # Seconds before the first retry; doubles on each further attempt
+K_MAX: Final[int] = 3 # Number of documents to retrieve
+# Hybrid retrieval: kNN and BM25 sub-queries are fused with reciprocal rank fusion (RRF), then cut to K_MAX
+KNN_EF_SEARCH: Final[int] = 100 # HNSW candidates examined by the kNN sub-query
+KNN_K: Final[int] = 50 # Hits returned by the kNN sub-query
+BM25_K: Final[int] = 50 # Hits returned by the BM25 sub-query
+RRF_WINDOW: Final[int] = 60 # Hits per sub-query considered for fusion
+RRF_RANK_CONSTANT: Final[int] = 20 # RRF score is 1 / (RRF_RANK_CONSTANT + rank)
+QUERY_EMBED_CACHE_SIZE: Final[int] = 1024 # Query embeddings kept in memory
+QUERY_EMBED_CACHE_TTL: Final[int] = 300 # Seconds a cached query embedding stays valid
+# Maximal marginal relevance over the fused candidates: lambda * sim(query) - (1 - lambda) * max sim(already picked)
+MMR_ENABLED: Final[bool] = True
+MMR_FETCH_K: Final[int] = 3 * K_MAX # Fused candidates considered for MMR
+MMR_LAMBDA: Final[float] = 0.7 # 1 ranks purely by relevance, 0 purely by diversity
+MAX_CONTEXT_TOKENS: Final[int] = 2500 # Prompt budget for retrieved context (MAX_TOKENS only limits the completion)
+ANSWER_CACHE_SIZE: Final[int] = 1024 # Cached RAG answers
+ANSWER_CACHE_TTL: Final[int] = 1800 # Seconds a cached answer is served before regenerating
+MIN_WORDS_FOR_TRANSLATION: Final[int] = 3 # Shorter queries are searched without an LLM translation
+CHAT_HISTORY_MAX_MESSAGES: Final[int] = 20 # Messages kept per chat (10 question/answer pairs)
+CHAT_HISTORY_MAX_CHATS: Final[int] = 10000 # Chats whose history is kept; the least recently active are dropped first
+MAX_INTERACTIONS_PER_CHAT: Final[int] = 32 # Recently used answers per chat whose sources/feedback buttons still work
+RAGAS_POOL_MAX_ENTRIES: Final[int] = 10_000 # Interactions kept in memory for evaluation
+PRESIGNED_URL_EXPIRATION: Final[int] = 3600 # Lifetime of S3 links in the sources message, in seconds
+PRESIGNED_URL_REFRESH_MARGIN: Final[int] = 60 # Re-sign a cached link this many seconds before it expires
+PRESIGNED_URL_CACHE_WINDOW: Final[int] = 1800 # Links signed within the same window are reused across chats
+PRESIGNED_URL_CACHE_SIZE: Final[int] = 2048 # Signed links kept in memory
 
 # File Paths
 # Path for storing/loading processed Langchain documents
-SERIALIZED_DOCS_FILE = 'processed_langchain_docs.json'
+SERIALIZED_DOCS_FILE: Final[str] = 'processed_langchain_docs.parquet'
+SERIALIZED_DOCS_COMPRESSION: Final[str] = 'zstd' # Parquet compression codec for SERIALIZED_DOCS_FILE
+SERIALIZED_DOCS_COMPRESSION_LEVEL: Final[int] = 3 # Low zstd level: most of the size win at a fraction of the CPU
+SERIALIZED_DOCS_FORMAT_VERSION: Final[int] = 1 # Bump to invalidate existing caches when the stored layout changes
+# Pre-parquet cache; read once and migrated to SERIALIZED_DOCS_FILE if present
+LEGACY_SERIALIZED_DOCS_FILE: Final[str] = 'processed_langchain_docs.json'
+# On-disk chunk embeddings keyed by SHA-256 of model + text; delete the folder to force re-embedding
+EMBEDDING_CACHE_DIR: Final[str] = 'emb_cache'
+RAGAS_LOG_FILE: Final[str] = 'ragas_data.jsonl' # Append-only interaction and feedback log for RAGAS evaluation
+# S3 listing ({key: etag, size, last_modified}) the cached documents were built from; unchanged files are not re-processed
+S3_MANIFEST_FILE: Final[str] = 'docs_manifest.json'
+# S3 listing whose documents are in the OpenSearch index; written only after indexing succeeds
+INDEX_MANIFEST_FILE: Final[str] = 'index_manifest.json'
+S3_PREFIX: Final[str] = '' # Overrides bucket_prefix from the S3 credentials file when set
+S3_MAX_POOL_CONNECTIONS: Final[int] = 64 # Connection pool of the shared S3 client
 
 # Credential file names (these files should be in the same directory as main.py or provide full paths)
-LLM_CRED_FILE = 'api-credentials.json'
-OPENSEARCH_CRED_FILE = 'credentials_opensearch.json'
-S3_CRED_FILE = 'accessbucket.json'
-TELEGRAM_CRED_FILE = 'tg-credentials.json'
+LLM_CRED_FILE: Final[str] = 'api-credentials.json'
+OPENSEARCH_CRED_FILE: Final[str] = 'credentials_opensearch.json'
+S3_CRED_FILE: Final[str] = 'accessbucket.json'
+TELEGRAM_CRED_FILE: Final[str] = 'tg-credentials.json'
 
 # Query Preprocessing
-SYNONYM_MAP = {
-    "course": ["program", "study plan", "module"], "courses": ["programs", "study plans", "modules"],
-    "deadline": ["due date", "submission date"], "application": ["admission", "enrollment"],
-    "GSOM": ["Graduate School of Management", "GSOM SPbU", "ВШМ"],
-    "SPbU": ["Saint Petersburg State University", "СПбГУ"],
-    "MiBA": ["Master in Business Analytics and Big Data", "Миба"],
-    "ML": ["Machine Learning", "машинное обучение"], "AI": ["Artificial Intelligence", "искусственный интеллект"],
-    "МЛ": ["Machine Learning", "машинное обучение"], "ИИ": ["Artificial Intelligence", "искусственный интеллект"],
-    "exam": ["examination", "test", "assessment", "экзамен", "тест"],
-    "schedule": ["timetable", "academic calendar", "расписание", "календарь"],
-    "расписание": ["timetable", "academic calendar", "расписание", "календарь"],
-    "обмен": ["включенное обучение", "included learning", "программа обмена", "outgoing", "exchange"],
-    "exchange program": ["included learning", "включенное обучение"],
-    "practice": ["practical training", "internship"],
-    "практика": ["practical training", "internship"]
-}
+# Synonyms live in a YAML asset that is only read the first time a query is expanded
+SYNONYM_FILE: Final[str] = str(_HERE / 'assets' / 'synonyms.yaml')
+
+@functools.lru_cache(maxsize=1)
+def get_synonym_map():
+    import yaml
+    with open(SYNONYM_FILE, 'rb') as f:
+        raw = yaml.safe_load(f) or {}
+    return MappingProxyType({k: tuple(v) for k, v in raw.items()})
+
+# Synonym matching: each map entry is a group of equivalent lowercase surface forms, and every form
+# maps to all forms of every group it belongs to, so expansion is one dict hit in either direction.
+@functools.lru_cache(maxsize=1)
+def get_synonym_of():
+    synonym_of = {}
+    for key, values in get_synonym_map().items():
+        group = [key.lower(), *(v.lower() for v in values)]
+        for form in group:
+            synonym_of.setdefault(form, []).extend(group)
+    # Tuples rather than sets keep expansion order (and the expanded query text) stable between runs
+    return MappingProxyType({form: tuple(dict.fromkeys(forms)) for form, forms in synonym_of.items()})
+
+@functools.lru_cache(maxsize=1)
+def _get_surface_spans():
+    # All forms are compiled once into a single automaton (hyperscan, then re2, then stdlib re)
+    surface_forms = sorted(get_synonym_of(), key=len, reverse=True) # Longest first so multi-word forms win
+    if not surface_forms:
+        return lambda text: []
+
+    try:
+        import hyperscan
+    except ImportError:
+        hyperscan = None
+
+    if hyperscan is not None:
+        hs_db = hyperscan.Database()
+        hs_db.compile(
+            expressions=[re.escape(form).encode('utf-8') for form in surface_forms],
+            ids=list(range(len(surface_forms))),
+            elements=len(surface_forms),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP | hyperscan.HS_FLAG_SOM_LEFTMOST] * len(surface_forms)
+        )
+
+        def _hyperscan_spans(text):
+            data = text.encode('utf-8')
+            spans = []
+
+            def _on_event(form_id, start, end, flags, context):
+                # hyperscan reports byte offsets; convert back to str offsets
+                char_start = len(data[:start].decode('utf-8'))
+                spans.append((char_start, char_start + len(data[start:end].decode('utf-8'))))
+
+            hs_db.scan(data, match_event_handler=_on_event)
+            return sorted(spans, key=lambda span: (span[0], -span[1]))
+
+        return _hyperscan_spans
+
+    alternation = "|".join(re.escape(form) for form in surface_forms)
+    try:
+        import re2
+        surface_regex = re2.compile("(?i)(" + alternation + ")")
+    except ImportError:
+        surface_regex = re.compile(r"(?i)\b(" + alternation + r")\b")
+    return lambda text: [match.span() for match in surface_regex.finditer(text)]
+
+def scan_synonyms(text, on_match):
+    """
+    Call on_match(form) for every whole-word synonym surface form in text, scanning it once.
+    Forms nested inside a longer match are reported too, so "gsom spbu" also yields "gsom" and "spbu".
+    """
+    synonym_of = get_synonym_of()
+    last_end = 0
+    for start, end in _get_surface_spans()(text):
+        if start < last_end:
+            continue # Overlaps a longer match already reported
+        if (start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum()):
+            continue # Not a whole word (re2 and hyperscan have no Unicode word boundaries)
+        last_end = end
+        form = text[start:end].lower()
+        on_match(form)
+        # The automaton only reports the longest match; shorter word runs inside it are plain dict lookups
+        words = form.split()
+        for size in range(len(words) - 1, 0, -1):
+            for i in range(len(words) - size + 1):
+                inner = " ".join(words[i:i + size])
+                if inner in synonym_of:
+                    on_match(inner)
+
+_STRIP_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+def expand_query(query):
+    """Append synonyms of every known term in the query, skipping words already present."""
+    synonym_of = get_synonym_of()
+    matched = []
+    scan_synonyms(query, matched.append)
+    # Built once per query; punctuation is stripped so "visa," still counts as "visa" being present.
+    # Matched multi-word forms are added up front so a later phrase is not appended as a synonym of an earlier one.
+    seen = set(query.lower().translate(_STRIP_PUNCTUATION).split())
+    seen.update(matched)
+    extra = []
+    for form in matched:
+        for syn in synonym_of.get(form, ()):
+            if syn not in seen:
+                seen.add(syn)
+                extra.append(syn)
+
+    return f"{query} {' '.join(extra)}" if extra else query
 
 # Telegram Bot
-HELP_TEXT_CONTENT = (
+HELP_TEXT_CONTENT: Final[str] = (
     "I can answer questions related to administrative information for MiBA students. "
-    "Ask your question, and I'll do my best to assist you based on the available knowledge base.\\n\\n"
-    "If you did not find an answer on your question, please contact the following people:\\n"
-    "1. Name Surname, MiBA Program Assistant. His contacts: tg - @<tg_name>\\n"
-    "2. Name Surname, GSOM Master Programs Manager. Her contacts: tg - @<tg_name>, mail - <mail>@gsom.spbu.ru\\n\\n"
+    "Ask your question, and I'll do my best to assist you based on the available knowledge base.\n\n"
+    "If you did not find an answer on your question, please contact the following people:\n"
+    "1. Name Surname, MiBA Program Assistant. His contacts: tg - @<tg_name>\n"
+    "2. Name Surname, GSOM Master Programs Manager. Her contacts: tg - @<tg_name>, mail - <mail>@gsom.spbu.ru\n\n"
 )
+# Escaped once at import; the help handler sends it with parse_mode='HTML'
+HELP_TEXT_HTML: Final[str] = html.escape(HELP_TEXT_CONTENT, quote=False)
+TELEGRAM_CONCURRENT_UPDATES: Final[int] = 32 # Updates handled at once, so a slow answer does not hold up button callbacks
+TELEGRAM_CONNECTION_POOL_SIZE: Final[int] = 64 # HTTP connections to the Bot API shared by all handlers
 
 # Document Processing
 # Set to True to re-process documents from S3 even if SERIALIZED_DOCS_FILE exists.
 # For normal bot operation, this should be False after initial setup.
-FORCE_PROCESS_DOCS_FROM_S3 = False
+FORCE_PROCESS_DOCS_FROM_S3: Final[bool] = False